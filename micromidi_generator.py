@@ -1,15 +1,29 @@
-import mido
-from mido import MidiFile, MidiTrack, Message, MetaMessage
+from array import array
 import csv
+import heapq
+from itertools import islice, repeat
+from operator import le, rshift
 import os
 import sys
-import re
+import struct
 
 # --- Configuration ---
 # Tempo 120 BPM = 0.5 seconds per beat
 # 480 ticks per beat (standard resolution)
 # Therefore: 960 ticks = 1 second
 TICKS_PER_SECOND = 960 
+TICKS_PER_BEAT = 480
+TEMPO = 500000 # Microseconds per beat
+
+# Letter+Accidental -> semitone offset from C (flats are upper-cased to 'B')
+_PITCH_TABLE = {}
+for _letter, _offset in {'C': 0, 'D': 2, 'E': 4, 'F': 5, 'G': 7, 'A': 9, 'B': 11}.items():
+    _PITCH_TABLE[_letter] = _offset
+    _PITCH_TABLE[_letter + '#'] = _offset + 1
+    _PITCH_TABLE[_letter + 'B'] = _offset - 1
+
+# Memoized results keyed by the raw note string
+_NOTE_CACHE = {}
 
 def note_name_to_midi(note_name):
     """
@@ -17,69 +31,186 @@ def note_name_to_midi(note_name):
     to a MIDI note number (0-127).
     Assumes C4 = MIDI 60.
     """
-    note_name = note_name.strip().upper()
-    
-    # Regex to separate Letter+Accidental from Octave
-    match = re.match(r"^([A-G][#B]?)(-?\d+)$", note_name)
-    if not match:
-        raise ValueError(f"Invalid note format: {note_name}")
-        
-    pitch_str, octave_str = match.groups()
-    
-    # Base offsets for C, D, E, F, G, A, B
-    offsets = {'C': 0, 'D': 2, 'E': 4, 'F': 5, 'G': 7, 'A': 9, 'B': 11}
-    
-    base_pitch = offsets[pitch_str[0]]
+    midi_note = _NOTE_CACHE.get(note_name)
+    if midi_note is not None:
+        return midi_note
+
+    normalized = note_name.strip().upper()
     
-    # Handle accidentals
-    if len(pitch_str) > 1:
-        if pitch_str[1] == '#':
-            base_pitch += 1
-        elif pitch_str[1] == 'B': # Handle flat (b)
-            base_pitch -= 1
-            
-    octave = int(octave_str)
+    # Split Letter+Accidental from Octave: LETTER [#|B] [-]DIGITS
+    pitch_len = 2 if normalized[1:2] in ('#', 'B') else 1
+    base_pitch = _PITCH_TABLE.get(normalized[:pitch_len])
+    octave_str = normalized[pitch_len:]
+    digits = octave_str[1:] if octave_str[:1] == '-' else octave_str
+    if base_pitch is None or not (digits.isascii() and digits.isdigit()):
+        raise ValueError(f"Invalid note format: {normalized}")
     
     # Formula: (Octave + 1) * 12 + Base
-    midi_note = (octave + 1) * 12 + base_pitch
+    midi_note = (int(octave_str) + 1) * 12 + base_pitch
     
     # Clamp to MIDI range
-    return max(0, min(127, midi_note))
+    midi_note = max(0, min(127, midi_note))
+    _NOTE_CACHE[note_name] = midi_note
+    return midi_note
 
-def write_events_to_track(track, event_list, channel):
+# Event type codes. The code doubles as the priority for events sharing a tick:
+# note_off, then pitchwheel, then note_on, so a new bend never leaks into the
+# release of the previous note.
+NOTE_OFF, PITCHWHEEL, NOTE_ON = 0, 1, 2
+
+# Events are packed into a single int so each stream fits a compact array('q')
+# and sorting/merging is a plain int compare:
+#   bits 16+   time in ticks
+#   bits 14-15 type code
+#   bits 0-13  the two data bytes in wire order (byte1 << 7 | byte2)
+_TIME_SHIFT = 16
+_TYPE_SHIFT = 14
+
+# Status bytes indexed by type code (OR'd with the channel)
+_STATUS_BYTES = (0x80, 0xE0, 0x90)
+
+def _write_vlq(buf, n):
     """
-    Helper function to write a sorted list of events to a specific MIDI track.
-    Calculates delta times based on the specific event list.
+    Appends n to buf as a MIDI variable-length quantity
+    (7 bits per byte, high bit set on all but the last byte).
+    """
+    if n < 0x80:
+        buf.append(n)
+        return
+    groups = [n & 0x7F]
+    n >>= 7
+    while n:
+        groups.append((n & 0x7F) | 0x80)
+        n >>= 7
+    buf.extend(reversed(groups))
+
+def _write_track_name(buf, name):
+    """
+    Appends a track_name meta event to buf at delta time 0.
+    """
+    data = name.encode('latin-1')
+    buf.extend(b'\x00\xff\x03')
+    _write_vlq(buf, len(data))
+    buf.extend(data)
+
+# Fixed setup/meta events, each at delta time 0
+_SET_TEMPO = b'\x00\xff\x51\x03' + TEMPO.to_bytes(3, 'big')
+_END_OF_TRACK = b'\x00\xff\x2f\x00'
+
+def _program_change(channel, program=0):
+    """
+    Returns a program_change event at delta time 0.
+    """
+    return bytes((0, 0xC0 | channel, program))
+
+# Encoded track bytes are handed to the output file in chunks of this size
+_FLUSH_SIZE = 1 << 16
+
+def write_events_to_track(out, buf, event_streams, channel):
+    """
+    Helper function to encode a track's event streams and stream them to out.
+    Streams already in time order are merged directly; only out-of-order
+    ones are copied and sorted. The streams are merged lazily and the
+    encoded bytes are appended to buf, which is flushed to out whenever it
+    grows past _FLUSH_SIZE (never, if out is None). Unflushed bytes are left
+    in buf for the caller.
+    Calculates delta times based on the merged event order.
     """
     last_tick_time = 0
-    
-    # Ensure events are sorted by time, then priority
-    event_list.sort(key=lambda x: (x['time'], x['priority']))
-
-    for event in event_list:
-        # Calculate Delta Time relative to THIS track's last event
-        delta_time = event['time'] - last_tick_time
-        if delta_time < 0: delta_time = 0
-        
-        if event['type'] == 'pitchwheel':
-            track.append(Message('pitchwheel', channel=channel, pitch=event['val'], time=delta_time))
-        elif event['type'] == 'note_on':
-            track.append(Message('note_on', channel=channel, note=event['note'], velocity=event['vel'], time=delta_time))
-        elif event['type'] == 'note_off':
-            track.append(Message('note_off', channel=channel, note=event['note'], velocity=event['vel'], time=delta_time))
-            
-        last_tick_time = event['time']
+    # Per-channel status bytes, indexed by type code
+    status_bytes = tuple(status | channel for status in _STATUS_BYTES)
+    write_vlq = _write_vlq
+    extend = buf.extend
+    flush_size = _FLUSH_SIZE if out is not None else sys.maxsize
+
+    # Ensure each stream is in time order. A stream holds a single type code, so
+    # merging only needs its time+type prefix to be non-decreasing; events
+    # sharing a tick may stay in row order. Pitch bends and note ons arrive in
+    # row order, so for time-ordered input they are merged straight from their
+    # arrays; only streams that are out of order (typically note offs,
+    # reordered by varying durations) get copied into a sorted list.
+    sorted_streams = []
+    for stream in event_streams:
+        keys = map(rshift, stream, repeat(_TYPE_SHIFT))
+        next_keys = map(rshift, islice(stream, 1, None), repeat(_TYPE_SHIFT))
+        if not all(map(le, keys, next_keys)):
+            # Stable sort on the time+type prefix keeps same-tick row order
+            stream = sorted(stream, key=lambda event: event >> _TYPE_SHIFT)
+        sorted_streams.append(stream)
 
-def generate_24edo_sequencer(input_filename, output_filename):
+    for event in heapq.merge(*sorted_streams):
+        # Calculate Delta Time relative to THIS track's last event.
+        # Times are non-negative and merged in order, so it is never negative.
+        time = event >> _TIME_SHIFT
+        delta_time = time - last_tick_time
+        status = status_bytes[(event >> _TYPE_SHIFT) & 3]
+
+        if delta_time < 0x80:
+            # Single-byte delta (includes the common zero delta between a
+            # pitch bend and its note on): write it with the event in one go
+            extend((delta_time, status, (event >> 7) & 0x7F, event & 0x7F))
+        else:
+            write_vlq(buf, delta_time)
+            extend((status, (event >> 7) & 0x7F, event & 0x7F))
+
+        if len(buf) >= flush_size:
+            out.write(buf)
+            buf.clear()
+
+        last_tick_time = time
+
+def _write_track(out, buf, event_streams, channel):
+    """
+    Writes one MTrk chunk: the setup events already in buf, the encoded
+    event streams, then end_of_track.
+    Seekable outputs are streamed and the chunk length is patched in once the
+    track is complete. Pipes and FIFOs can't seek back, so there the track is
+    encoded in memory first and its length written up front.
+    """
+    if out.seekable():
+        start = out.tell()
+        out.write(struct.pack('>4sI', b'MTrk', 0))
+        write_events_to_track(out, buf, event_streams, channel)
+        buf.extend(_END_OF_TRACK)
+        out.write(buf)
+
+        end = out.tell()
+        out.seek(start + 4)
+        out.write(struct.pack('>I', end - start - 8))
+        out.seek(end)
+    else:
+        write_events_to_track(None, buf, event_streams, channel)
+        buf.extend(_END_OF_TRACK)
+        out.write(struct.pack('>4sI', b'MTrk', len(buf)))
+        out.write(buf)
+
+def generate_24edo_sequencer(input_filename, output_filename, *, multi_track=True):
+    """
+    Converts a micromidi CSV into a MIDI file.
+    With multi_track, unbent notes go to a channel 0 track and bent notes to
+    a channel 1 track. Otherwise every note is written to a single channel 0
+    track, each preceded by its pitch bend (including 0, to reset it).
+    """
     if not os.path.exists(input_filename):
         print(f"ERROR: Input file not found: {input_filename}")
         return
 
     # 1. Parsing
-    # We will split events into two lists immediately
-    clean_events = [] # For Channel 0 (No bend)
-    bent_events = []  # For Channel 1 (With bend)
+    # Each track keeps separate (note offs, pitch bends, note ons) streams of
+    # packed events, indexed by type code
+    clean_events = (array('q'), array('q'), array('q')) # For Channel 0 (No bend)
+    if multi_track:
+        bent_events = (array('q'), array('q'), array('q'))  # For Channel 1 (With bend)
+    else:
+        bent_events = clean_events
+    events_by_bend = (clean_events, bent_events) # Indexed by (bend != 0)
+    always_bend = not multi_track
     
+    # Locals for the row loop
+    ticks_per_second = TICKS_PER_SECOND
+    int_, float_, round_ = int, float, round
+    to_midi = note_name_to_midi
+
     try:
         with open(input_filename, mode='r', newline='') as file:
             reader = csv.reader(file)
@@ -88,50 +219,45 @@ def generate_24edo_sequencer(input_filename, output_filename):
                 if len(row) >= 5:
                     try:
                         # Columns: Note_Name, Pitch_Bend, Time, Velocity, Duration
-                        raw_note = row[0].strip()
-                        bend_val = int(row[1].strip())
-                        velocity = int(round(float(row[2].strip()) * 127))
-                        duration_sec = float(row[3].strip())
-                        start_time_sec = float(row[4].strip())
+                        # int()/float() accept surrounding whitespace, and
+                        # note_name_to_midi strips the note itself
+                        bend_val = int_(row[1])
+                        velocity = int_(round_(float_(row[2]) * 127))
+                        if not -8192 <= bend_val <= 8191:
+                            raise ValueError(f"Pitch bend out of range: {bend_val}")
+                        if not 0 <= velocity <= 127:
+                            raise ValueError(f"Velocity out of range: {velocity}")
+                        duration_sec = float_(row[3])
+                        start_time_sec = float_(row[4])
                         
-                        midi_note = note_name_to_midi(raw_note)
-                        start_ticks = int(start_time_sec * TICKS_PER_SECOND)
-                        duration_ticks = int(duration_sec * TICKS_PER_SECOND)
+                        midi_note = to_midi(row[0])
+                        start_ticks = int_(start_time_sec * ticks_per_second)
+                        duration_ticks = int_(duration_sec * ticks_per_second)
                         end_ticks = start_ticks + duration_ticks
+                        if start_ticks < 0 or duration_ticks < 0:
+                            raise ValueError("Negative time or duration")
                         
                         # Determine which list and channel logic to use
                         # If bend is NOT 0, it goes to the "Bent" track
                         # If bend IS 0, it goes to the "Clean" track
-                        target_list = bent_events if bend_val != 0 else clean_events
+                        is_bent = bend_val != 0
+                        note_offs, bends, note_ons = events_by_bend[is_bent]
                         
                         # --- Create Events ---
+                        start_key = start_ticks << _TIME_SHIFT
                         
                         # Only add pitch bend event if it is the bent track
-                        if bend_val != 0:
-                            target_list.append({
-                                'time': start_ticks, 
-                                'priority': 0, 
-                                'type': 'pitchwheel', 
-                                'val': bend_val
-                            })
+                        if is_bent or always_bend:
+                            # 14-bit unsigned value, LSB first
+                            bend_val += 8192
+                            bends.append(start_key | PITCHWHEEL << _TYPE_SHIFT
+                                         | (bend_val & 0x7F) << 7 | bend_val >> 7)
                         
                         # Note On
-                        target_list.append({
-                            'time': start_ticks, 
-                            'priority': 1, 
-                            'type': 'note_on', 
-                            'note': midi_note, 
-                            'vel': velocity
-                        })
+                        note_ons.append(start_key | NOTE_ON << _TYPE_SHIFT | midi_note << 7 | velocity)
                         
                         # Note Off
-                        target_list.append({
-                            'time': end_ticks, 
-                            'priority': 0,
-                            'type': 'note_off', 
-                            'note': midi_note, 
-                            'vel': 0
-                        })
+                        note_offs.append(end_ticks << _TIME_SHIFT | NOTE_OFF << _TYPE_SHIFT | midi_note << 7)
 
                     except ValueError as e:
                         print(f"Skipping invalid row {row}: {e}")
@@ -140,57 +266,71 @@ def generate_24edo_sequencer(input_filename, output_filename):
         print(f"File Error: {e}")
         return
 
-    if not clean_events and not bent_events:
+    clean_count = len(clean_events[NOTE_ON])
+    bent_count = len(bent_events[NOTE_ON]) if multi_track else 0
+    if not clean_count and not bent_count:
         print("No valid events found.")
         return
 
     # 2. Write to MIDI
-    # Type 1 = Multi-track synchronous
-    mid = MidiFile(type=1)
-    
-    # --- Track 1: Meta Data & Clean Notes (Channel 0) ---
-    track_clean = MidiTrack()
-    track_clean.name = "Standard Notes"
-    mid.tracks.append(track_clean)
-    
-    # Add Tempo/Meta to the first track
-    track_clean.append(MetaMessage('set_tempo', tempo=500000, time=0))
-    track_clean.append(Message('program_change', channel=0, program=0, time=0))
-    
-    # Write clean events to Channel 0
-    write_events_to_track(track_clean, clean_events, channel=0)
-    track_clean.append(MetaMessage('end_of_track', time=0))
-
-    # --- Track 2: Bent Notes (Channel 1) ---
-    if bent_events:
-        track_bent = MidiTrack()
-        track_bent.name = "Microtonal Notes"
-        mid.tracks.append(track_bent)
-        
-        # Initialize Channel 1
-        track_bent.append(Message('program_change', channel=1, program=0, time=0))
-        
-        # Write bent events to Channel 1
-        write_events_to_track(track_bent, bent_events, channel=1)
-        track_bent.append(MetaMessage('end_of_track', time=0))
-
-    mid.save(output_filename)
+    # Type 1 = Multi-track synchronous, Type 0 = single track
+    num_tracks = 2 if bent_count else 1
+    file_type = 1 if multi_track else 0
+
+    # Large buffer so the file goes out in a few big writes
+    try:
+        with open(output_filename, 'wb', buffering=1 << 20) as f:
+            f.write(struct.pack('>4sIHHH', b'MThd', 6, file_type, num_tracks, TICKS_PER_BEAT))
+
+            # --- Track 1: Meta Data & Clean Notes (Channel 0) ---
+            buf = bytearray()
+            _write_track_name(buf, "Standard Notes")
+            
+            # Add Tempo/Meta to the first track
+            buf.extend(_SET_TEMPO)
+            buf.extend(_program_change(0))
+            
+            # Write clean events to Channel 0
+            _write_track(f, buf, clean_events, channel=0)
+
+            # --- Track 2: Bent Notes (Channel 1) ---
+            if bent_count:
+                buf = bytearray()
+                _write_track_name(buf, "Microtonal Notes")
+                
+                # Initialize Channel 1
+                buf.extend(_program_change(1))
+                
+                # Write bent events to Channel 1
+                _write_track(f, buf, bent_events, channel=1)
+    except OSError as e:
+        print(f"File Error: {e}")
+        return
+
     print(f"Success! Saved to {output_filename}")
-    print(f"Stats: {len(clean_events)//2} standard notes, {len(bent_events)//3} bent notes.")
+    if multi_track:
+        print(f"Stats: {clean_count} standard notes, {bent_count} bent notes.")
+    else:
+        print(f"Stats: {clean_count} notes.")
 
 # --- Execution ---
-if len(sys.argv) < 3:
-    print("Usage: python script.py <input.csv> <output.mid>")
-    # Create dummy file for user convenience if run without args
-    dummy_csv = "sequencer_input.csv"
-    if not os.path.exists(dummy_csv):
-        with open(dummy_csv, 'w') as f:
-            f.write("Note_Name,Pitch_Bend,Time,Velocity,Duration\n")
-            f.write("C4,0,0.0,100,1.0\n")       # Clean Track
-            f.write("C4,2048,0.5,100,1.0\n")    # Bent Track (Overlap to test interference)
-            f.write("E4,0,2.0,90,0.5\n")        # Clean Track
-            f.write("G4,-2048,2.5,90,0.5\n")    # Bent Track
-        print(f"Created demo input file: {dummy_csv}")
-    sys.exit(1)
-
-generate_24edo_sequencer(sys.argv[1], sys.argv[2])
\ No newline at end of file
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    multi_track = '--single-track' not in args
+    args = [arg for arg in args if arg != '--single-track']
+
+    if len(args) < 2:
+        print("Usage: python script.py <input.csv> <output.mid> [--single-track]")
+        # Create dummy file for user convenience if run without args
+        dummy_csv = "sequencer_input.csv"
+        if not os.path.exists(dummy_csv):
+            with open(dummy_csv, 'w') as f:
+                f.write("Note_Name,Pitch_Bend,Time,Velocity,Duration\n")
+                f.write("C4,0,0.0,100,1.0\n")       # Clean Track
+                f.write("C4,2048,0.5,100,1.0\n")    # Bent Track (Overlap to test interference)
+                f.write("E4,0,2.0,90,0.5\n")        # Clean Track
+                f.write("G4,-2048,2.5,90,0.5\n")    # Bent Track
+            print(f"Created demo input file: {dummy_csv}")
+        sys.exit(1)
+
+    generate_24edo_sequencer(args[0], args[1], multi_track=multi_track)